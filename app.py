@@ -1,5 +1,6 @@
 import os
-from flask import Flask, render_template
+import click
+from flask import Flask, render_template, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 
@@ -22,8 +23,14 @@ with app.app_context():
     import auth
     import questionnaire
     import chatbot
-    db.drop_all()  # Drop all existing tables
-    db.create_all()  # Create new tables with updated schema
+    # Wiping the database on startup is opt-in (e.g. after schema changes);
+    # CLI commands such as export-snapshot must see the existing data
+    if os.environ.get("RESET_DATABASE") == "1":
+        db.drop_all()
+    db.create_all()
+    # Existing databases keep their tables: add new columns and backfill them
+    models.upgrade_schema()
+    auth.backfill_token_hashes()
 
 # Register blueprints
 from auth import auth_bp
@@ -34,6 +41,24 @@ app.register_blueprint(auth_bp)
 app.register_blueprint(questionnaire_bp)
 app.register_blueprint(chatbot_bp)
 
+from profiling import init_profiling
+init_profiling(app)
+
+@app.cli.command('export-snapshot')
+@click.argument('out_dir', default=os.path.join('instance', 'snapshot'))
+def export_snapshot_command(out_dir):
+    """Append new chat history and questionnaire rows to a columnar snapshot."""
+    from snapshot import export_snapshot
+    exported = export_snapshot(out_dir)
+    for table_name, rows in exported.items():
+        click.echo(f"{table_name}: {rows} new rows")
+
+@app.cli.command('backfill-sessions')
+def backfill_sessions_command():
+    """Compute session fields for existing chat history rows."""
+    from sessions import backfill_sessions
+    click.echo(f"{backfill_sessions()} rows updated")
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -46,5 +71,10 @@ def questionnaire():
 def dashboard():
     return render_template('dashboard.html')
 
+@app.route('/metrics')
+def metrics_report():
+    from metrics import metrics
+    return jsonify(metrics.snapshot())
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
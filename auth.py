@@ -1,6 +1,11 @@
 import jwt
 import datetime
 import re
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
 from flask import Blueprint, request, jsonify, current_app
 from models import User, db
 from functools import wraps
@@ -8,6 +13,73 @@ from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
 auth_bp = Blueprint('auth', __name__)
 
+TOKEN_CACHE_SIZE = 4096
+
+def hash_token(token):
+    """Fixed-width digest used for token lookups and as the verification cache key"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+class TokenCache:
+    """
+    Bounded LRU of successfully verified tokens, keyed by token digest.
+    Entries are only served until the token's own expiry.
+    """
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            user_id, exp = entry
+            if exp <= time.time():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return user_id
+
+    def put(self, digest, user_id, exp):
+        with self._lock:
+            self._entries[digest] = (user_id, exp)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+token_cache = TokenCache()
+
+def verify_token(token):
+    """
+    Return (user_id, token digest) for a valid token. Signature verification
+    only runs on cache misses; jwt exceptions propagate to the caller.
+    """
+    digest = hash_token(token)
+    user_id = token_cache.get(digest)
+    if user_id is None:
+        data = jwt.decode(
+            token,
+            current_app.config.get('SECRET_KEY'),
+            algorithms=["HS256"],
+            options={"require": ["exp", "sub"]}
+        )
+        user_id = data['sub']
+        token_cache.put(digest, user_id, data['exp'])
+    return user_id, digest
+
+def backfill_token_hashes():
+    """Fill token_hash for users whose token was issued before the column existed"""
+    users = User.query.filter(User.token.isnot(None), User.token_hash.is_(None)).all()
+    for user in users:
+        user.token_hash = hash_token(user.token)
+    db.session.commit()
+    return len(users)
+
 def is_valid_email(email):
     pattern = r'^[\w\.-]+@[\w\.-]+\.\w+$'
     return re.match(pattern, email) is not None
@@ -36,8 +108,8 @@ def token_required(f):
         if not token:
             return jsonify({'error': 'Token is missing'}), 401
         try:
-            data = jwt.decode(token, current_app.config.get('SECRET_KEY'), algorithms=["HS256"])
-            current_user = User.query.filter_by(id=data['sub']).first()
+            user_id, _ = verify_token(token)
+            current_user = db.session.get(User, user_id)
             if not current_user:
                 return jsonify({'error': 'User not found'}), 401
         except jwt.ExpiredSignatureError:
@@ -78,6 +150,7 @@ def get_token():
             db.session.flush()  # Get the ID without committing
             token = generate_token(new_user.id)
             new_user.token = token
+            new_user.token_hash = hash_token(token)
             db.session.commit()
             return jsonify({'token': token}), 201
         except Exception as e:
@@ -103,12 +176,18 @@ def login():
         
         try:
             # Verify token is valid JWT
-            jwt.decode(token, current_app.config.get('SECRET_KEY'), algorithms=["HS256"])
+            user_id, digest = verify_token(token)
         except jwt.InvalidTokenError:
             return jsonify({'error': 'Invalid token format'}), 401
 
-        user = User.query.filter_by(token=token).first()
-        if not user:
+        # Primary key lookup, then make sure this is the token issued to the user
+        user = db.session.get(User, user_id)
+        if user and user.token_hash is None and user.token:
+            # Token issued before token_hash existed: fill it in on first use
+            if hmac.compare_digest(user.token.encode(), token.encode()):
+                user.token_hash = digest
+                db.session.commit()
+        if not user or not user.token_hash or not hmac.compare_digest(user.token_hash, digest):
             return jsonify({'error': 'User not found with this token'}), 401
 
         return jsonify({
@@ -0,0 +1,75 @@
+"""
+Microbenchmarks for the authentication path: token decode, user lookup and
+full token_required overhead. Runs against an in-memory SQLite database:
+
+    python benchmarks/auth_bench.py [--users 1000] [--number 2000]
+"""
+import os
+import sys
+import argparse
+import timeit
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("MISTRAL_API_KEY", "benchmark")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt
+from app import app
+from models import User, db
+from auth import generate_token, hash_token, token_cache, token_required, verify_token
+
+def report(name, seconds, number):
+    print(f"{name:<40} {seconds / number * 1e6:10.2f} us/op")
+
+def seed_users(count):
+    users = []
+    for i in range(count):
+        user = User(email=f"bench{i}@example.com", questionnaire_completed=False)
+        db.session.add(user)
+        db.session.flush()
+        user.token = generate_token(user.id)
+        user.token_hash = hash_token(user.token)
+        users.append(user)
+    db.session.commit()
+    return users
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+    number = args.number
+
+    with app.app_context():
+        users = seed_users(args.users)
+        target = users[len(users) // 2]
+        token, user_id, digest = target.token, target.id, target.token_hash
+        secret = app.config.get("SECRET_KEY")
+
+        print("-- decode")
+        report("jwt.decode (HS256 verify)",
+               timeit.timeit(lambda: jwt.decode(token, secret, algorithms=["HS256"]), number=number), number)
+        token_cache.clear()
+        report("verify_token (cache hit)",
+               timeit.timeit(lambda: verify_token(token), number=number), number)
+
+        print("-- lookup")
+        db.session.expunge_all()
+        report("filter_by(token=...) (old login)",
+               timeit.timeit(lambda: User.query.filter_by(token=token).first(), number=number), number)
+        report("filter_by(token_hash=...)",
+               timeit.timeit(lambda: User.query.filter_by(token_hash=digest).first(), number=number), number)
+        report("session.get(User, sub)",
+               timeit.timeit(lambda: db.session.get(User, user_id), number=number), number)
+
+        print("-- middleware")
+        protected = token_required(lambda current_user: current_user.id)
+        with app.test_request_context(headers={"Authorization": token}):
+            token_cache.clear()
+            report("token_required (cold cache per call)",
+                   timeit.timeit(lambda: (token_cache.clear(), protected()), number=number), number)
+            report("token_required (warm cache)",
+                   timeit.timeit(protected, number=number), number)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Exercise ResilientLLMClient against a local fault-injecting Mistral API stub
+(no network or API key needed):
+
+    python benchmarks/llm_faults.py [--requests 50] [--hedge]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mistralai.client import MistralClient
+from mistralai.models.chat_completion import ChatMessage
+from metrics import metrics
+from llm_client import ResilientLLMClient, CircuitBreaker
+
+# Current fault profile, switched between scenarios; slow_next delays the
+# next N requests by slow_delay regardless of slow_rate; drop_rate closes the
+# connection without replying
+FAULTS = {'error_rate': 0.0, 'slow_rate': 0.0, 'slow_delay': 0.0, 'delay': 0.02, 'slow_next': 0,
+          'drop_rate': 0.0}
+_faults_lock = threading.Lock()
+
+def _take_slow_next():
+    with _faults_lock:
+        if FAULTS['slow_next'] > 0:
+            FAULTS['slow_next'] -= 1
+            return True
+        return False
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        if random.random() < FAULTS['drop_rate']:
+            self.close_connection = True
+            return
+        if random.random() < FAULTS['error_rate']:
+            self.send_response(503)
+            self.end_headers()
+            self.wfile.write(b'{"message": "injected outage"}')
+            return
+        delay = FAULTS['delay']
+        if _take_slow_next() or random.random() < FAULTS['slow_rate']:
+            delay += FAULTS['slow_delay']
+        time.sleep(delay)
+        payload = {
+            'id': 'stub',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': 'respuesta de prueba'},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': 10, 'completion_tokens': 3, 'total_tokens': 13}
+        }
+        data = json.dumps(payload).encode('utf-8')
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except BrokenPipeError:
+            # Client gave up (deadline or losing hedge)
+            pass
+
+SCENARIOS = [
+    ('healthy', {'error_rate': 0.0, 'slow_rate': 0.0}),
+    ('slow tail', {'error_rate': 0.0, 'slow_rate': 0.1, 'slow_delay': 0.6}),
+    ('flaky', {'error_rate': 0.3, 'slow_rate': 0.0}),
+    ('outage', {'error_rate': 1.0, 'slow_rate': 0.0}),
+    ('dropped', {'error_rate': 0.0, 'drop_rate': 1.0}),
+    ('recovery', {'error_rate': 0.0, 'slow_rate': 0.0, 'drop_rate': 0.0}),
+]
+
+def run_scenario(client, name, requests):
+    latencies = []
+    sources = {}
+    for i in range(requests):
+        messages = [ChatMessage(role='user', content=f'pregunta {i % 10}')]
+        start = time.time()
+        result = client.chat(model='mistral-tiny', messages=messages, max_tokens=50)
+        latencies.append(time.time() - start)
+        sources[result.source] = sources.get(result.source, 0) + 1
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<10} p50={p50 * 1000:7.1f}ms p99={p99 * 1000:7.1f}ms "
+          f"max={latencies[-1] * 1000:7.1f}ms breaker={client.breaker.state:<9} {sources}")
+
+def start_stub():
+    """Serve StubHandler on a free local port; returns (server, endpoint)."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--hedge', action='store_true')
+    args = parser.parse_args()
+
+    server, endpoint = start_stub()
+
+    client = ResilientLLMClient(
+        MistralClient(api_key='stub', endpoint=endpoint, max_retries=0, timeout=1.0),
+        attempt_timeout=1.0,
+        breaker=CircuitBreaker(failure_threshold=5, reset_timeout=0.5),
+        hedge=args.hedge
+    )
+    for name, faults in SCENARIOS:
+        FAULTS.update(faults)
+        if name == 'recovery':
+            time.sleep(client.breaker.reset_timeout)
+        run_scenario(client, name, args.requests)
+
+    print(json.dumps(metrics.snapshot()['counters'], indent=2, sort_keys=True))
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -3,9 +3,13 @@ import nltk
 from flask import Blueprint, request, jsonify
 from models import User, ChatHistory, QuestionnaireResponse, db
 from auth import token_required
+from prompts import assemble_prompt, preload_prompts
+from llm_policy import llm_policy
+from llm_client import ResilientLLMClient, ATTEMPT_TIMEOUT
+from sessions import session_tracker
 from mistralai.client import MistralClient
-from mistralai.models.chat_completion import ChatMessage
 from datetime import datetime
+from functools import lru_cache
 import json
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
@@ -24,6 +28,9 @@ def download_nltk_data():
         nltk.download('punkt', download_dir=nltk_data_dir, quiet=True)
         nltk.download('stopwords', download_dir=nltk_data_dir, quiet=True)
         nltk.download('averaged_perceptron_tagger', download_dir=nltk_data_dir, quiet=True)
+        # Resource names used by word_tokenize / pos_tag since NLTK 3.9
+        nltk.download('punkt_tab', download_dir=nltk_data_dir, quiet=True)
+        nltk.download('averaged_perceptron_tagger_eng', download_dir=nltk_data_dir, quiet=True)
         nltk.download('spanish_grammars', download_dir=nltk_data_dir, quiet=True)
         nltk.download('maxent_ne_chunker', download_dir=nltk_data_dir, quiet=True)
         nltk.download('words', download_dir=nltk_data_dir, quiet=True)
@@ -38,7 +45,26 @@ if not download_nltk_data():
 chatbot_bp = Blueprint('chatbot', __name__)
 
 MISTRAL_API_KEY = os.environ.get("MISTRAL_API_KEY")
-mistral_client = MistralClient(api_key=MISTRAL_API_KEY)
+# Retries and deadlines are handled by ResilientLLMClient, not the SDK
+mistral_client = MistralClient(api_key=MISTRAL_API_KEY, max_retries=0, timeout=ATTEMPT_TIMEOUT)
+llm_client = ResilientLLMClient(mistral_client)
+
+@lru_cache(maxsize=None)
+def get_spanish_stopwords():
+    return frozenset(stopwords.words('spanish'))
+
+def preload_nlp_resources():
+    """
+    Load the read-only NLP data used per request (stopwords, tokenizer, POS
+    tagger, prompt prefixes). Called in the serving master before forking so
+    every worker shares it copy-on-write instead of loading its own copy.
+    """
+    try:
+        get_spanish_stopwords()
+        nltk.pos_tag(word_tokenize("precarga de recursos"))
+    except Exception as e:
+        print(f"Warning: NLTK tokenizer/tagger not preloaded, each worker will load its own copy: {e}")
+    preload_prompts()
 
 def extract_topics(text):
     """
@@ -52,7 +78,7 @@ def extract_topics(text):
             pos_tags = nltk.pos_tag(tokens)
             
             # Filter for nouns and important words
-            spanish_stopwords = set(stopwords.words('spanish'))
+            spanish_stopwords = get_spanish_stopwords()
             important_words = [word for word, pos in pos_tags 
                              if word not in spanish_stopwords 
                              and pos.startswith(('NN', 'VB', 'JJ'))
@@ -181,32 +207,6 @@ def find_similar_questions(query, user_id):
         print(f"Error finding similar questions: {e}")
         return []
 
-def get_tailored_prompt(user_type, message, user_progress, similar_interactions):
-    """
-    Generate a context-aware prompt based on user type and history
-    """
-    # Base prompt structure
-    system_message = {
-        "ESTRUCTURADO": "Eres un tutor que proporciona explicaciones detalladas y sistemáticas, con ejemplos paso a paso.",
-        "EXPLORADOR": "Eres un guía que fomenta el descubrimiento y proporciona múltiples perspectivas y conexiones.",
-        "INTENSIVO": "Eres un mentor que se enfoca en aplicaciones prácticas y resultados concretos."
-    }.get(user_type, "Eres un tutor adaptativo que personaliza sus respuestas según las necesidades del estudiante.")
-    
-    # Add learning context
-    context = f"\nEl estudiante tiene un ritmo de aprendizaje {user_progress['learning_pace']} "
-    context += f"y ha completado {user_progress['total_interactions']} interacciones previas. "
-    
-    if similar_interactions:
-        context += "\nHay preguntas similares previas que pueden ser relevantes."
-    
-    # Create the message list
-    messages = [
-        ChatMessage(role="system", content=system_message + context),
-        ChatMessage(role="user", content=message)
-    ]
-    
-    return messages
-
 def calculate_response_complexity(user_progress, current_mastery):
     """
     Calculate appropriate complexity level for the response
@@ -231,6 +231,17 @@ def calculate_response_complexity(user_progress, current_mastery):
         print(f"Error calculating complexity: {e}")
         return 1
 
+def get_latency_budget():
+    """
+    Optional per-request latency budget in seconds from the X-Latency-Budget-Ms
+    header; None falls back to the policy default
+    """
+    try:
+        budget_ms = float(request.headers.get('X-Latency-Budget-Ms', ''))
+    except ValueError:
+        return None
+    return budget_ms / 1000 if budget_ms > 0 else None
+
 @chatbot_bp.route('/chat', methods=['POST'])
 @token_required
 def chat(current_user):
@@ -259,33 +270,64 @@ def chat(current_user):
         current_mastery = user_progress['mastery_scores'].get(main_topic, 0)
         
         # Get tailored prompt and generate response
-        messages = get_tailored_prompt(
+        prompt = assemble_prompt(
             current_user.user_type, 
             full_message,
             user_progress,
             similar_interactions
         )
         
-        chat_response = mistral_client.chat(
-            model="mistral-tiny",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=500
+        # Pick model tier and answer length for this complexity and latency budget
+        complexity_level = calculate_response_complexity(user_progress, current_mastery)
+        llm_params = llm_policy.choose(
+            complexity_level,
+            user_progress['learning_pace'],
+            get_latency_budget()
         )
         
-        ai_response = chat_response.choices[0].message.content
-        
-        # Calculate complexity and create chat history
-        complexity_level = calculate_response_complexity(user_progress, current_mastery)
+        with llm_policy.track(llm_params) as llm_call:
+            llm_result = llm_client.chat(
+                model=llm_params.model,
+                messages=prompt.messages,
+                temperature=llm_params.temperature,
+                max_tokens=llm_params.max_tokens
+            )
+            usage = llm_result.usage
+            llm_call.completion_tokens = getattr(usage, 'completion_tokens', None)
+            llm_call.attempt_latency = llm_result.latency
+            llm_call.failed = llm_result.source != 'upstream'
+        
+        ai_response = llm_result.content
+        # Prefer the provider's count, fall back to our estimate
+        prompt_tokens = getattr(usage, 'prompt_tokens', None) or prompt.prompt_tokens
+        
+        if llm_result.source == 'degraded':
+            # Canned outage notice: not part of the learning history, so it is
+            # neither stored (similar questions, sessions, snapshots) nor rateable
+            return jsonify({
+                'response': ai_response,
+                'complexity_level': complexity_level,
+                'prompt_tokens': prompt_tokens,
+                'model': llm_params.model,
+                'response_source': llm_result.source
+            }), 200
+        
+        response_time = time.time() - start_time
+        timestamp = datetime.utcnow()
+        session_fields = session_tracker.record_interaction(
+            current_user.id, main_topic, response_time, timestamp
+        )
         
         chat_entry = ChatHistory(
             user_id=current_user.id,
             message=full_message,
             response=ai_response,
+            timestamp=timestamp,
             topic=main_topic,
             complexity_level=complexity_level,
-            response_time=time.time() - start_time,
-            preferred_pace=user_progress['learning_pace']
+            response_time=response_time,
+            preferred_pace=user_progress['learning_pace'],
+            **session_fields
         )
         
         db.session.add(chat_entry)
@@ -294,7 +336,10 @@ def chat(current_user):
         return jsonify({
             'response': ai_response,
             'chat_id': chat_entry.id,
-            'complexity_level': complexity_level
+            'complexity_level': complexity_level,
+            'prompt_tokens': prompt_tokens,
+            'model': llm_params.model,
+            'response_source': llm_result.source
         }), 200
         
     except Exception as e:
@@ -302,28 +347,150 @@ def chat(current_user):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+FEEDBACK_BATCH_LIMIT = 100
+FEEDBACK_COMMENTS_MAX_LENGTH = 2000
+
+def compute_interaction_quality(helpful, understanding):
+    """
+    Combined quality score (0-1) from the thumbs and comprehension feedback
+    """
+    parts = []
+    if helpful is not None:
+        parts.append(1.0 if helpful else 0.0)
+    if understanding is not None:
+        parts.append((understanding - 1) / 4)
+    return sum(parts) / len(parts) if parts else None
+
+def parse_chat_id(value):
+    """
+    Chat ID as an int, accepting numeric strings as sent by form-style
+    clients; None if it isn't one
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+def validate_feedback_item(item):
+    """
+    Return (item with chat_id as an int, None) for a valid feedback item,
+    or (None, error message)
+    """
+    if not isinstance(item, dict):
+        return None, 'Each feedback item must be an object'
+    if item.get('chat_id') in (None, ''):
+        return None, 'Chat ID is required'
+    chat_id = parse_chat_id(item['chat_id'])
+    if chat_id is None:
+        return None, 'Chat ID must be an integer'
+    helpful = item.get('helpful')
+    if helpful is not None and not isinstance(helpful, bool):
+        return None, f'Invalid helpful value for chat {chat_id}'
+    understanding = item.get('understanding')
+    if understanding is not None and (
+        not isinstance(understanding, int) or isinstance(understanding, bool) or not 1 <= understanding <= 5
+    ):
+        return None, f'Invalid understanding value for chat {chat_id}'
+    comments = item.get('comments')
+    if comments is not None and (
+        not isinstance(comments, str) or len(comments) > FEEDBACK_COMMENTS_MAX_LENGTH
+    ):
+        return None, f'Invalid comments for chat {chat_id}'
+    return dict(item, chat_id=chat_id), None
+
+def apply_feedback(user_id, items):
+    """
+    Coalesce feedback items per chat, check ownership with a single IN query
+    and write everything, including the derived quality scores and the
+    mastery of the rated topics from the earliest changed rating on, as one
+    bulk UPDATE. Returns the list of chat ids that were not found.
+    The caller commits.
+    """
+    coalesced = {}
+    for item in items:
+        entry = coalesced.setdefault(item['chat_id'], {})
+        for field in ('helpful', 'understanding', 'comments'):
+            if item.get(field) is not None:
+                entry[field] = item[field]
+
+    rows = db.session.query(
+        ChatHistory.id,
+        ChatHistory.topic,
+        ChatHistory.helpful,
+        ChatHistory.user_understanding
+    ).filter(
+        ChatHistory.id.in_(coalesced),
+        ChatHistory.user_id == user_id
+    ).order_by(ChatHistory.id).all()
+    not_found = sorted(set(coalesced) - {row.id for row in rows})
+    if not rows:
+        return not_found
+
+    updates = []
+    for row in rows:
+        feedback = coalesced[row.id]
+        helpful = feedback.get('helpful', row.helpful)
+        understanding = feedback.get('understanding', row.user_understanding)
+        update = {'id': row.id, 'helpful': helpful, 'user_understanding': understanding}
+        if 'comments' in feedback:
+            update['feedback_comments'] = feedback['comments']
+        update['interaction_quality'] = compute_interaction_quality(helpful, understanding)
+        updates.append(update)
+
+    # Mastery is the running average of understanding / 5 over each topic's
+    # rated messages (as in analyze_user_progress). A changed rating shifts
+    # every later value of its topic, so recompute from the earliest one
+    updates_by_id = {update['id']: update for update in updates}
+    first_changed = {}
+    for row in rows:
+        if row.topic and updates_by_id[row.id]['user_understanding'] != row.user_understanding:
+            first_changed[row.topic] = min(first_changed.get(row.topic, row.id), row.id)
+    for topic, first_id in first_changed.items():
+        base = db.session.query(ChatHistory.mastery_level).filter(
+            ChatHistory.user_id == user_id,
+            ChatHistory.topic == topic,
+            ChatHistory.mastery_level.isnot(None),
+            ChatHistory.id < first_id
+        ).order_by(ChatHistory.id.desc()).first()
+        mastery = base.mastery_level if base else None
+        chain = db.session.query(ChatHistory.id, ChatHistory.user_understanding).filter(
+            ChatHistory.user_id == user_id,
+            ChatHistory.topic == topic,
+            ChatHistory.id >= first_id
+        ).order_by(ChatHistory.id).all()
+        for chat in chain:
+            update = updates_by_id.get(chat.id)
+            understanding = update['user_understanding'] if update else chat.user_understanding
+            if understanding is not None:
+                mastery = ((mastery or 0) + understanding / 5.0) / 2
+            if update is None:
+                update = updates_by_id[chat.id] = {'id': chat.id}
+                updates.append(update)
+            update['mastery_level'] = mastery
+
+    db.session.execute(db.update(ChatHistory), updates)
+    return not_found
+
 @chatbot_bp.route('/chat_feedback', methods=['POST'])
 @token_required
 def chat_feedback(current_user):
     try:
         data = request.get_json()
-        chat_id = data.get('chat_id')
-        helpful = data.get('helpful')
-        understanding = data.get('understanding')
-        
-        if not chat_id:
+        if not data:
             return jsonify({'error': 'Chat ID is required'}), 400
+        
+        item, error = validate_feedback_item(data)
+        if error:
+            return jsonify({'error': error}), 400
             
-        chat_entry = ChatHistory.query.get(chat_id)
-        if not chat_entry or chat_entry.user_id != current_user.id:
+        not_found = apply_feedback(current_user.id, [item])
+        if not_found:
+            db.session.rollback()
             return jsonify({'error': 'Chat entry not found'}), 404
             
-        if helpful is not None:
-            chat_entry.helpful = helpful
-            
-        if understanding is not None:
-            chat_entry.user_understanding = understanding
-            
         db.session.commit()
         return jsonify({'message': 'Feedback received'}), 200
         
@@ -332,6 +499,38 @@ def chat_feedback(current_user):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@chatbot_bp.route('/chat_feedback_batch', methods=['POST'])
+@token_required
+def chat_feedback_batch(current_user):
+    try:
+        data = request.get_json()
+        items = data.get('items') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'Feedback items are required'}), 400
+        if len(items) > FEEDBACK_BATCH_LIMIT:
+            return jsonify({'error': f'At most {FEEDBACK_BATCH_LIMIT} feedback items per request'}), 400
+        
+        validated = []
+        for item in items:
+            item, error = validate_feedback_item(item)
+            if error:
+                return jsonify({'error': error}), 400
+            validated.append(item)
+        items = validated
+        
+        not_found = apply_feedback(current_user.id, items)
+        db.session.commit()
+        return jsonify({
+            'message': 'Feedback received',
+            'updated': len({item['chat_id'] for item in items}) - len(not_found),
+            'not_found': not_found
+        }), 200
+        
+    except Exception as e:
+        print(f"Error in batch chat feedback: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @chatbot_bp.route('/learning_report', methods=['GET'])
 @token_required
 def get_learning_report(current_user):
@@ -341,7 +540,9 @@ def get_learning_report(current_user):
         chat_history = ChatHistory.query.filter_by(user_id=current_user.id).order_by(ChatHistory.timestamp.desc()).first()
         
         # Calculate time spent (in hours)
-        total_time = sum([chat.session_duration or 0 for chat in ChatHistory.query.filter_by(user_id=current_user.id).all()]) / 3600
+        total_time = (db.session.query(db.func.sum(ChatHistory.session_duration)).filter(
+            ChatHistory.user_id == current_user.id
+        ).scalar() or 0) / 3600
         
         # Get session count
         session_count = ChatHistory.query.filter_by(user_id=current_user.id).count()
@@ -0,0 +1,44 @@
+import gc
+import os
+
+# Production serving profile: gunicorn -c gunicorn.conf.py
+#
+# The app and its read-only NLP resources are loaded once in the master
+# (preload_app) and shared copy-on-write by the forked workers.
+#
+# Reloads:
+#   kill -HUP <master>    graceful worker rotation with the preloaded code
+#   kill -USR2 <master>   re-exec the master to pick up new code, then
+#                         send -TERM to the old master once the new one is up
+
+wsgi_app = "wsgi:app"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread" if threads > 1 else "sync"
+preload_app = True
+
+# LLM responses can take a while; keep the worker timeout above the slowest call
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# Recycle workers periodically so slow leaks don't accumulate
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+accesslog = "-"
+errorlog = "-"
+
+def pre_fork(server, worker):
+    # Move preloaded objects out of the GC's generations so collections in
+    # the workers don't write to (and un-share) their pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    # Pooled DB connections opened in the master must not be shared
+    from app import app
+    from models import db
+    with app.app_context():
+        db.engine.dispose(close=False)
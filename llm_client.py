@@ -0,0 +1,229 @@
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from mistralai.exceptions import (
+    MistralException,
+    MistralAPIException,
+    MistralAPIStatusException,
+    MistralConnectionException
+)
+from metrics import metrics
+
+ATTEMPT_TIMEOUT = float(os.environ.get("LLM_ATTEMPT_TIMEOUT", 20.0))  # seconds per attempt
+MAX_ATTEMPTS = int(os.environ.get("LLM_MAX_ATTEMPTS", 3))
+BACKOFF_BASE = 0.25
+BACKOFF_MAX = 4.0
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("LLM_BREAKER_FAILURES", 5))
+BREAKER_RESET_TIMEOUT = float(os.environ.get("LLM_BREAKER_RESET", 30.0))
+HEDGE_ENABLED = os.environ.get("LLM_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+FALLBACK_CACHE_SIZE = 1024
+EXECUTOR_WORKERS = int(os.environ.get("LLM_EXECUTOR_WORKERS", 16))
+
+DEGRADED_RESPONSE = (
+    "En este momento no puedo generar una respuesta completa. "
+    "Por favor, inténtalo de nuevo en unos minutos."
+)
+
+# source is one of: upstream, cache, degraded; latency is the duration of the
+# attempt that produced the response (None for fallbacks)
+LLMResult = namedtuple('LLMResult', ['content', 'usage', 'source', 'latency'])
+
+def is_retryable(error):
+    if isinstance(error, (TimeoutError, MistralConnectionException, MistralAPIStatusException)):
+        return True
+    if isinstance(error, MistralAPIException):
+        return error.http_status is None or error.http_status == 429 or error.http_status >= 500
+    # mistralai raises a bare MistralException for transport errors (read
+    # timeouts, dropped connections) and for other 5xx codes
+    return isinstance(error, MistralException)
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+class CircuitBreaker:
+    """
+    closed -> open after consecutive failures; open -> half_open after the
+    reset timeout; a half_open probe closes the circuit or re-opens it.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT, name='llm'):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        metrics.incr(f'{self.name}.breaker.{self.state}_to_{state}')
+        self.state = state
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.time() - self._opened_at < self.reset_timeout:
+                    return False
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def release(self):
+        """End a call that says nothing about upstream health."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = time.time()
+                self._transition(self.OPEN)
+
+class ResilientLLMClient:
+    """
+    Wraps a MistralClient-compatible object with per-attempt deadlines,
+    jittered retries, a circuit breaker, optional hedged requests and a
+    cached/degraded fallback. chat() never raises for upstream failures.
+    """
+    def __init__(self, client, attempt_timeout=ATTEMPT_TIMEOUT, max_attempts=MAX_ATTEMPTS,
+                 breaker=None, hedge=HEDGE_ENABLED, cache_size=FALLBACK_CACHE_SIZE,
+                 executor=None):
+        self.client = client
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max_attempts
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.cache_size = cache_size
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=EXECUTOR_WORKERS, thread_name_prefix='llm'
+        )
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _cache_key(self, messages):
+        # The whole conversation, system prompt included: the same question
+        # asked under another profile or context must not get this answer
+        return tuple((m.role, ' '.join(m.content.lower().split())) for m in messages)
+
+    def _cache_get(self, key):
+        with self._cache_lock:
+            content = self._cache.get(key)
+            if content is not None:
+                self._cache.move_to_end(key)
+            return content
+
+    def _cache_put(self, key, content):
+        with self._cache_lock:
+            self._cache[key] = content
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _hedge_delay(self, model):
+        if not self.hedge:
+            return None
+        name = f'llm.attempt_latency.{model}'
+        if metrics.count(name) < HEDGE_MIN_SAMPLES:
+            return None
+        return metrics.percentile(name, HEDGE_PERCENTILE)
+
+    def _call(self, kwargs):
+        start = time.time()
+        response = self.client.chat(**kwargs)
+        elapsed = time.time() - start
+        metrics.observe(f"llm.attempt_latency.{kwargs.get('model')}", elapsed)
+        return response, elapsed
+
+    def _attempt(self, kwargs):
+        """
+        One attempt bounded by the deadline, with an optional hedged duplicate.
+        Returns (response, seconds taken by the call that answered).
+        """
+        deadline = time.time() + self.attempt_timeout
+        futures = [self.executor.submit(self._call, kwargs)]
+        hedge_delay = self._hedge_delay(kwargs.get('model'))
+        if hedge_delay is not None and hedge_delay < self.attempt_timeout:
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done:
+                metrics.incr('llm.hedge.fired')
+                futures.append(self.executor.submit(self._call, kwargs))
+
+        error = None
+        pending = set(futures)
+        while pending:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if len(futures) > 1 and future is futures[1]:
+                        metrics.incr('llm.hedge.won')
+                    return future.result()
+                error = future.exception()
+        # Abandoned calls finish in the background; their results are dropped
+        for future in pending:
+            future.cancel()
+        if pending or error is None:
+            metrics.incr('llm.timeout')
+            raise TimeoutError(f"LLM attempt exceeded {self.attempt_timeout}s")
+        raise error
+
+    def _fallback(self, key):
+        content = self._cache_get(key)
+        if content is not None:
+            metrics.incr('llm.fallback.cached')
+            return LLMResult(content, None, 'cache', None)
+        metrics.incr('llm.fallback.degraded')
+        return LLMResult(DEGRADED_RESPONSE, None, 'degraded', None)
+
+    def chat(self, **kwargs):
+        key = self._cache_key(kwargs['messages'])
+        for attempt in range(self.max_attempts):
+            if not self.breaker.allow():
+                metrics.incr('llm.breaker.rejected')
+                return self._fallback(key)
+            try:
+                response, latency = self._attempt(kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    # Bad request on our side, not an upstream health problem:
+                    # neither a failure nor proof that upstream has recovered
+                    self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                metrics.incr('llm.attempt_failed')
+                print(f"LLM attempt {attempt + 1}/{self.max_attempts} failed: {e}")
+                if attempt + 1 < self.max_attempts:
+                    metrics.incr('llm.retry')
+                    time.sleep(backoff_delay(attempt))
+                continue
+            self.breaker.record_success()
+            content = response.choices[0].message.content
+            self._cache_put(key, content)
+            return LLMResult(content, getattr(response, 'usage', None), 'upstream', latency)
+        return self._fallback(key)
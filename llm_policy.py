@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from metrics import metrics
+
+# Model tiers, cheapest first
+MODEL_TIERS = tuple(os.environ.get(
+    "LLM_MODEL_TIERS", "mistral-tiny,mistral-small,mistral-medium"
+).split(","))
+
+# Complexity level (see calculate_response_complexity) -> (tier index, max_tokens)
+COMPLEXITY_PROFILES = {
+    1: (0, 150),
+    2: (0, 250),
+    3: (1, 350),
+    4: (1, 500),
+    5: (2, 700)
+}
+
+# Slow learners get fuller explanations, fast learners shorter ones
+PACE_FACTORS = {
+    'slow': 1.2,
+    'moderate': 1.0,
+    'fast': 0.75,
+    'variable': 1.0
+}
+
+DEFAULT_LATENCY_BUDGET = float(os.environ.get("LLM_LATENCY_BUDGET", 15.0))  # seconds
+# In-flight calls are counted per worker process, which serves at most
+# GUNICORN_THREADS requests at once: degrade when all but one thread are
+# already waiting on the LLM
+WORKER_THREADS = int(os.environ.get("GUNICORN_THREADS", 4))
+OVERLOAD_INFLIGHT = int(os.environ.get("LLM_OVERLOAD_INFLIGHT", max(1, WORKER_THREADS - 1)))
+MIN_MAX_TOKENS = 64
+TEMPERATURE = 0.7
+
+# Initial latency model (request overhead + seconds per generated token),
+# refined per tier from observed calls
+BASE_LATENCY = 0.5
+SECONDS_PER_TOKEN = {0: 0.01, 1: 0.015, 2: 0.025}
+EWMA_ALPHA = 0.2
+
+LLMParams = namedtuple('LLMParams', ['model', 'tier', 'max_tokens', 'temperature', 'degraded'])
+
+class TrackedCall:
+    def __init__(self):
+        self.completion_tokens = None
+        self.attempt_latency = None
+        self.failed = False
+
+class LLMPolicy:
+    """
+    Chooses model tier and max_tokens per request from the response complexity,
+    the learner's pace and a latency budget, degrading under overload.
+    """
+    def __init__(self, tiers=MODEL_TIERS, overload_inflight=OVERLOAD_INFLIGHT):
+        self.tiers = tiers
+        self.overload_inflight = overload_inflight
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._seconds_per_token = {
+            tier: SECONDS_PER_TOKEN.get(tier, SECONDS_PER_TOKEN[2]) for tier in range(len(tiers))
+        }
+
+    @property
+    def inflight(self):
+        return self._inflight
+
+    def estimate_latency(self, tier, max_tokens):
+        return BASE_LATENCY + self._seconds_per_token[tier] * max_tokens
+
+    def choose(self, complexity, preferred_pace=None, latency_budget=None):
+        tier, max_tokens = COMPLEXITY_PROFILES.get(complexity, COMPLEXITY_PROFILES[1])
+        tier = min(tier, len(self.tiers) - 1)
+        max_tokens = int(max_tokens * PACE_FACTORS.get(preferred_pace, 1.0))
+        budget = latency_budget if latency_budget and latency_budget > 0 else DEFAULT_LATENCY_BUDGET
+
+        degraded = self._inflight >= self.overload_inflight
+        if degraded:
+            tier = max(0, tier - 1)
+            max_tokens //= 2
+            metrics.incr('llm.policy.overload_degraded')
+
+        # Shorten the answer to fit the budget; when that would cut it below
+        # half of the profile length, step down to a faster tier instead
+        floor = max(MIN_MAX_TOKENS, max_tokens // 2)
+        while self.estimate_latency(tier, max_tokens) > budget:
+            affordable = int((budget - BASE_LATENCY) / self._seconds_per_token[tier])
+            if affordable >= floor or tier == 0:
+                max_tokens = affordable
+                metrics.incr('llm.policy.budget_truncated')
+                break
+            tier -= 1
+            metrics.incr('llm.policy.budget_downgraded')
+        max_tokens = max(MIN_MAX_TOKENS, max_tokens)
+
+        model = self.tiers[tier]
+        metrics.incr(f'llm.tier.{model}')
+        return LLMParams(model, tier, max_tokens, TEMPERATURE, degraded)
+
+    def track(self, params):
+        return _Tracker(self, params)
+
+    def _record(self, params, elapsed, call):
+        metrics.observe(f'llm.latency.{params.model}', elapsed)
+        if call.failed:
+            metrics.incr(f'llm.errors.{params.model}')
+            return
+        # Fit the per-token cost on the attempt that answered: the end-to-end
+        # time also includes retries and backoff sleeps
+        if call.completion_tokens and call.attempt_latency is not None:
+            observed = max(0.0, call.attempt_latency - BASE_LATENCY) / call.completion_tokens
+            with self._lock:
+                current = self._seconds_per_token[params.tier]
+                self._seconds_per_token[params.tier] = (1 - EWMA_ALPHA) * current + EWMA_ALPHA * observed
+
+class _Tracker:
+    def __init__(self, policy, params):
+        self.policy = policy
+        self.params = params
+        self.call = TrackedCall()
+
+    def __enter__(self):
+        with self.policy._lock:
+            self.policy._inflight += 1
+        self.start = time.time()
+        return self.call
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.time() - self.start
+        with self.policy._lock:
+            self.policy._inflight -= 1
+        if exc_type is not None:
+            self.call.failed = True
+        self.policy._record(self.params, elapsed, self.call)
+        return False
+
+llm_policy = LLMPolicy()
@@ -0,0 +1,62 @@
+import threading
+from collections import defaultdict, deque
+
+LATENCY_WINDOW = 1024
+
+class Metrics:
+    """
+    Thread-safe in-process counters and latency summaries. Values are per
+    process (per gunicorn worker).
+    """
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._samples = {}
+        self._totals = defaultdict(lambda: [0, 0.0])
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+            totals = self._totals[name]
+            totals[0] += 1
+            totals[1] += seconds
+
+    def count(self, name):
+        with self._lock:
+            return self._totals[name][0] if name in self._totals else 0
+
+    def percentile(self, name, q):
+        """q-th percentile (0-100) over the recent window, or None without samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            names = list(self._samples)
+            totals = {name: tuple(self._totals[name]) for name in names}
+        latencies = {}
+        for name in names:
+            count, total = totals[name]
+            latencies[name] = {
+                'count': count,
+                'mean': total / count if count else None,
+                'p50': self.percentile(name, 50),
+                'p95': self.percentile(name, 95),
+                'p99': self.percentile(name, 99)
+            }
+        return {'counters': counters, 'latencies': latencies}
+
+metrics = Metrics()
@@ -1,4 +1,5 @@
 from app import db
+from sqlalchemy import inspect, text
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 
@@ -6,6 +7,7 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     token = db.Column(db.String(500), unique=True, nullable=True)
+    token_hash = db.Column(db.String(64), unique=True, index=True, nullable=True)  # sha256 of token
     password_hash = db.Column(db.String(256), nullable=True, default=None)
     user_type = db.Column(db.String(20), nullable=True, default=None)
     questionnaire_completed = db.Column(db.Boolean, nullable=False, default=False)
@@ -67,3 +69,14 @@ class ChatHistory(db.Model):
     session_duration = db.Column(db.Integer)  # Time spent on this interaction
     preferred_pace = db.Column(db.String(20))  # User's learning pace preference
     interaction_quality = db.Column(db.Float)  # Combined quality score (0-1)
+
+def upgrade_schema():
+    """
+    Add columns introduced after a table was first created: create_all()
+    only creates missing tables. Safe to run on every startup.
+    """
+    columns = {column['name'] for column in inspect(db.engine).get_columns('user')}
+    if 'token_hash' not in columns:
+        with db.engine.begin() as conn:
+            conn.execute(text('ALTER TABLE "user" ADD COLUMN token_hash VARCHAR(64)'))
+            conn.execute(text('CREATE UNIQUE INDEX ix_user_token_hash ON "user" (token_hash)'))
@@ -0,0 +1,170 @@
+import os
+import sys
+import hmac
+import time
+import cProfile
+import threading
+from collections import Counter
+from datetime import datetime
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from models import db
+
+# Opt-in: nothing below is registered unless PROFILING_ENABLED=1
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN")  # X-Profile header value for cProfile captures
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join("instance", "profiles"))
+SLOW_REQUEST_THRESHOLD = float(os.environ.get("SLOW_REQUEST_THRESHOLD", 2.0))  # seconds
+SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.01))  # seconds
+REPEATED_QUERY_THRESHOLD = 5  # same statement this many times in one request looks like N+1
+MAX_STACK_DEPTH = 64
+
+def _profile_path(kind, extension):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    endpoint = (request.endpoint or 'unknown').replace('.', '_')
+    stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S-%f')
+    return os.path.join(PROFILE_DIR, f"{stamp}-{kind}-{endpoint}-{os.getpid()}.{extension}")
+
+def _collapse_stack(frame):
+    """Stack in collapsed (flame graph) format, outermost frame first"""
+    parts = []
+    while frame is not None and len(parts) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+class SlowRequestSampler:
+    """
+    Background thread sampling the stacks of in-flight requests once they run
+    longer than SLOW_REQUEST_THRESHOLD. Requests below the threshold are never
+    sampled.
+    """
+    def __init__(self, threshold=SLOW_REQUEST_THRESHOLD, interval=SAMPLE_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_running(self):
+        # Threads don't survive fork, so restart in each worker process
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='slow-request-sampler', daemon=True)
+        self._thread.start()
+
+    def begin(self, start):
+        self._ensure_running()
+        samples = Counter()
+        with self._lock:
+            self._inflight[threading.get_ident()] = (start, samples)
+        return samples
+
+    def end(self):
+        with self._lock:
+            self._inflight.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.time()
+            with self._lock:
+                slow = [(ident, samples) for ident, (start, samples) in self._inflight.items()
+                        if now - start >= self.threshold]
+            if not slow:
+                continue
+            frames = sys._current_frames()
+            stacks = [(ident, samples, _collapse_stack(frames[ident]))
+                      for ident, samples in slow if ident in frames]
+            del frames
+            with self._lock:
+                for ident, samples, stack in stacks:
+                    # Skip requests that finished while we were sampling
+                    if ident in self._inflight and self._inflight[ident][1] is samples:
+                        samples[stack] += 1
+
+sampler = SlowRequestSampler()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('query_start', []).append(time.time())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or not conn.info.get('query_start'):
+        return
+    elapsed = time.time() - conn.info['query_start'].pop()
+    if 'sql_count' in g:
+        g.sql_count += 1
+        g.sql_time += elapsed
+        g.sql_statements[statement] += 1
+
+def _before_request():
+    g.request_start = time.time()
+    g.sql_count = 0
+    g.sql_time = 0.0
+    g.sql_statements = Counter()
+    g.stack_samples = sampler.begin(g.request_start)
+
+    token = request.headers.get('X-Profile')
+    if PROFILING_TOKEN and token and hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode()):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            g.profiler = profiler
+        except ValueError as e:
+            # Python 3.12+ allows a single active profiler per process
+            print(f"Profiling not started: {e}")
+
+def _after_request(response):
+    if 'request_start' not in g:
+        return response
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        path = _profile_path('cprofile', 'prof')
+        profiler.dump_stats(path)
+        response.headers['X-Profile-File'] = os.path.basename(path)
+
+    elapsed = time.time() - g.request_start
+    response.headers['X-SQL-Queries'] = str(g.sql_count)
+    response.headers['X-SQL-Time-Ms'] = f"{g.sql_time * 1000:.1f}"
+
+    repeated = {statement: count for statement, count in g.sql_statements.items()
+                if count >= REPEATED_QUERY_THRESHOLD}
+    print(f"[profile] {request.method} {request.path} {elapsed * 1000:.1f}ms "
+          f"sql={g.sql_count} ({g.sql_time * 1000:.1f}ms) repeated={len(repeated)}")
+    for statement, count in repeated.items():
+        print(f"[profile]   possible N+1 ({count}x): {' '.join(statement.split())[:200]}")
+    return response
+
+def _teardown_request(exception=None):
+    sampler.end()
+    samples = g.pop('stack_samples', None)
+    if samples:
+        path = _profile_path('slow', 'folded')
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"[profile] slow request {request.path}: {sum(samples.values())} stack samples in {path}")
+
+def init_profiling(app):
+    """
+    Register the profiling hooks when PROFILING_ENABLED=1:
+    - per-request cProfile capture for requests sending X-Profile: <PROFILING_TOKEN>
+    - stack sampling of requests slower than SLOW_REQUEST_THRESHOLD
+    - SQL query count/time per request (X-SQL-Queries / X-SQL-Time-Ms headers)
+      with repeated statements logged as possible N+1 queries
+    When disabled no hook is installed, so there is no per-request overhead.
+    """
+    if not PROFILING_ENABLED:
+        return False
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    return True
@@ -0,0 +1,80 @@
+import sys
+from collections import namedtuple
+from functools import lru_cache
+from mistralai.models.chat_completion import ChatMessage
+
+# System prompts per user profile (see questionnaire.classify_user)
+SYSTEM_MESSAGES = {
+    "ESTRUCTURADO": "Eres un tutor que proporciona explicaciones detalladas y sistemáticas, con ejemplos paso a paso.",
+    "EXPLORADOR": "Eres un guía que fomenta el descubrimiento y proporciona múltiples perspectivas y conexiones.",
+    "INTENSIVO": "Eres un mentor que se enfoca en aplicaciones prácticas y resultados concretos."
+}
+DEFAULT_SYSTEM_MESSAGE = "Eres un tutor adaptativo que personaliza sus respuestas según las necesidades del estudiante."
+
+LEARNING_PACES = ('slow', 'moderate', 'fast', 'variable')
+
+# Coarse interaction buckets: (lower bound, description). Bucketing keeps the
+# system prefix identical across requests so provider-side prefix caching hits.
+INTERACTION_BUCKETS = (
+    (0, "no ha completado interacciones previas"),
+    (1, "ha completado menos de 10 interacciones previas"),
+    (10, "ha completado entre 10 y 50 interacciones previas"),
+    (50, "ha completado más de 50 interacciones previas"),
+)
+
+PACE_TEMPLATE = "\nEl estudiante tiene un ritmo de aprendizaje {pace} y {interactions}. "
+SIMILAR_CONTEXT = "\nHay preguntas similares previas que pueden ser relevantes."
+
+# Rough chars-per-token ratio for Mistral's tokenizer on Spanish text
+CHARS_PER_TOKEN = 4
+
+Prompt = namedtuple('Prompt', ['messages', 'prompt_tokens', 'prefix_key'])
+
+def estimate_tokens(text):
+    return max(1, -(-len(text) // CHARS_PER_TOKEN))
+
+def interaction_bucket(total_interactions):
+    bucket = 0
+    for index, (lower, _) in enumerate(INTERACTION_BUCKETS):
+        if total_interactions >= lower:
+            bucket = index
+    return bucket
+
+@lru_cache(maxsize=256)
+def get_system_message(user_type, learning_pace, bucket, has_similar):
+    """
+    Interned system prefix for a profile. The same ChatMessage instance is
+    shared by every request with this profile, always in the same field order.
+    """
+    content = SYSTEM_MESSAGES.get(user_type, DEFAULT_SYSTEM_MESSAGE)
+    content += PACE_TEMPLATE.format(pace=learning_pace, interactions=INTERACTION_BUCKETS[bucket][1])
+    if has_similar:
+        content += SIMILAR_CONTEXT
+    content = sys.intern(content)
+    return ChatMessage(role="system", content=content), estimate_tokens(content)
+
+def assemble_prompt(user_type, message, user_progress, similar_interactions):
+    """
+    Build the message list for a chat request. Only the user message is
+    allocated per call; the system prefix comes from the profile cache.
+    """
+    learning_pace = user_progress.get('learning_pace', 'moderate')
+    if learning_pace not in LEARNING_PACES:
+        learning_pace = 'moderate'
+    prefix_key = (
+        user_type,
+        learning_pace,
+        interaction_bucket(user_progress.get('total_interactions', 0)),
+        bool(similar_interactions)
+    )
+    system_message, system_tokens = get_system_message(*prefix_key)
+    messages = [system_message, ChatMessage(role="user", content=message)]
+    return Prompt(messages, system_tokens + estimate_tokens(message), prefix_key)
+
+def preload_prompts():
+    """Populate the prefix cache for every known profile."""
+    for user_type in list(SYSTEM_MESSAGES) + [None]:
+        for learning_pace in LEARNING_PACES:
+            for bucket in range(len(INTERACTION_BUCKETS)):
+                for has_similar in (False, True):
+                    get_system_message(user_type, learning_pace, bucket, has_similar)
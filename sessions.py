@@ -0,0 +1,302 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+from scipy.signal import lfilter
+from models import ChatHistory, db
+
+SESSION_GAP = int(os.environ.get("SESSION_INACTIVITY_GAP", 30 * 60))  # seconds
+FLUSH_INTERVAL = 60  # seconds between evictions of closed sessions
+MAX_TRACKED_USERS = 10000
+BACKFILL_BATCH_SIZE = 1000
+SESSION_SCAN_BATCH = 200  # rows per query when re-reading where a session started
+
+def clamp(value, low, high):
+    return max(low, min(high, value))
+
+class UserSession:
+    """In-memory state of a user's current session"""
+    __slots__ = ('started_at', 'last_activity', 'start_mastery')
+
+    def __init__(self, started_at, last_activity):
+        self.started_at = started_at
+        self.last_activity = last_activity
+        self.start_mastery = {}
+
+class SessionTracker:
+    """
+    Groups each user's messages into sessions separated by SESSION_GAP of
+    inactivity and derives the ChatHistory session fields at insert time:
+
+    - session_duration: seconds since the user's previous message, which
+      already include this message's response time; the first message of a
+      session counts its response time (so the sum over a session is its
+      length)
+    - mastery_level: current mastery of the topic
+    - learning_progress: mastery change for the topic since the session started
+    - interaction_quality: mean feedback quality of the session so far; the
+      real score replaces it once the message is rated (apply_feedback)
+
+    Several workers may write rows for the same user, so the gap, the topic
+    mastery and the session quality are read from the user's latest rows
+    (indexed queries, no history scan). The in-memory state only remembers
+    where the session started and the mastery at that point per topic, and
+    is trusted only while the user's latest row is the one this process
+    wrote; otherwise the session start is re-read from the current session's
+    rows. Closed sessions are flushed out of memory every FLUSH_INTERVAL
+    seconds.
+    """
+    def __init__(self, gap=SESSION_GAP, max_users=MAX_TRACKED_USERS):
+        self.gap = gap
+        self.max_users = max_users
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+
+    def _latest_timestamp(self, user_id):
+        row = db.session.query(ChatHistory.timestamp).filter(
+            ChatHistory.user_id == user_id
+        ).order_by(ChatHistory.id.desc()).first()
+        return row.timestamp if row else None
+
+    def _session_start(self, user_id, latest):
+        """Walk back from the latest row to the start of its session."""
+        started_at = latest
+        before_id = None
+        while True:
+            query = db.session.query(ChatHistory.id, ChatHistory.timestamp).filter(
+                ChatHistory.user_id == user_id
+            )
+            if before_id is not None:
+                query = query.filter(ChatHistory.id < before_id)
+            rows = query.order_by(ChatHistory.id.desc()).limit(SESSION_SCAN_BATCH).all()
+            for row in rows:
+                if row.timestamp is None:
+                    return started_at
+                gap = (started_at - row.timestamp).total_seconds()
+                if gap < 0 or gap > self.gap:
+                    return started_at
+                started_at = row.timestamp
+            if len(rows) < SESSION_SCAN_BATCH:
+                return started_at
+            before_id = rows[-1].id
+
+    def _topic_mastery(self, user_id, topic, before_id=None):
+        query = db.session.query(ChatHistory.mastery_level).filter(
+            ChatHistory.user_id == user_id,
+            ChatHistory.topic == topic,
+            ChatHistory.mastery_level.isnot(None)
+        )
+        if before_id is not None:
+            query = query.filter(ChatHistory.id < before_id)
+        row = query.order_by(ChatHistory.id.desc()).first()
+        return row.mastery_level if row else None
+
+    def _start_mastery(self, user_id, topic, started_at, mastery):
+        """Mastery of the topic before its first message of the session."""
+        first = db.session.query(db.func.min(ChatHistory.id)).filter(
+            ChatHistory.user_id == user_id,
+            ChatHistory.topic == topic,
+            ChatHistory.timestamp >= started_at
+        ).scalar()
+        if first is None:
+            return mastery
+        return self._topic_mastery(user_id, topic, before_id=first)
+
+    def _session_quality(self, user_id, started_at):
+        """Mean quality of the rated messages of the session."""
+        quality = db.session.query(db.func.avg(ChatHistory.interaction_quality)).filter(
+            ChatHistory.user_id == user_id,
+            ChatHistory.timestamp >= started_at,
+            db.or_(ChatHistory.helpful.isnot(None), ChatHistory.user_understanding.isnot(None))
+        ).scalar()
+        return float(quality) if quality is not None else None
+
+    def record_interaction(self, user_id, topic, response_time=0.0, now=None):
+        """
+        Advance the user's session for a new message and return the derived
+        ChatHistory fields.
+        """
+        now = now or datetime.utcnow()
+        latest = self._latest_timestamp(user_id)
+        gap = (now - latest).total_seconds() if latest else None
+        new_session = gap is None or gap < 0 or gap > self.gap
+
+        with self._lock:
+            session = self._sessions.get(user_id)
+        if new_session:
+            session = UserSession(now, now)
+        elif session is None or session.last_activity != latest:
+            # Another worker wrote the latest row, or this process hasn't
+            # seen the user yet: re-read where the session started
+            started_at = self._session_start(user_id, latest)
+            if session is None or session.started_at != started_at:
+                session = UserSession(started_at, latest)
+        session.last_activity = now
+
+        mastery = self._topic_mastery(user_id, topic) if topic else None
+        if topic and topic not in session.start_mastery:
+            session.start_mastery[topic] = self._start_mastery(user_id, topic, session.started_at, mastery)
+        learning_progress = None
+        if mastery is not None:
+            learning_progress = clamp(mastery - (session.start_mastery.get(topic) or 0), -1, 1)
+
+        fields = {
+            'session_duration': int(round((response_time or 0) if new_session else gap)),
+            'mastery_level': mastery,
+            'learning_progress': learning_progress,
+            'interaction_quality': None if new_session else self._session_quality(user_id, session.started_at)
+        }
+
+        with self._lock:
+            self._sessions[user_id] = session
+            self._sessions.move_to_end(user_id)
+            while len(self._sessions) > self.max_users:
+                self._sessions.popitem(last=False)
+        self._maybe_flush()
+        return fields
+
+    def _maybe_flush(self):
+        if time.time() - self._last_flush < FLUSH_INTERVAL:
+            return
+        self.flush()
+
+    def flush(self, now=None):
+        """Drop the state of sessions that have been closed by inactivity."""
+        now = now or datetime.utcnow()
+        with self._lock:
+            self._last_flush = time.time()
+            closed = [
+                user_id for user_id, session in self._sessions.items()
+                if (now - session.last_activity).total_seconds() > self.gap
+            ]
+            for user_id in closed:
+                del self._sessions[user_id]
+        return len(closed)
+
+session_tracker = SessionTracker()
+
+def _interaction_quality(helpful, understanding):
+    """Vectorized counterpart of chatbot.compute_interaction_quality"""
+    parts = np.vstack([helpful, (understanding - 1) / 4])
+    counts = np.sum(~np.isnan(parts), axis=0)
+    totals = np.nansum(parts, axis=0)
+    return np.where(counts > 0, totals / np.maximum(counts, 1), np.nan)
+
+def compute_session_fields(user_ids, timestamps, topics, understanding, helpful, response_times, gap=SESSION_GAP):
+    """
+    Derive the session fields for whole histories at once. Inputs are arrays
+    sorted by (user_id, timestamp); timestamps in seconds, topics as integer
+    codes (-1 for none), understanding/helpful/response_times as floats with NaN
+    for missing values. Mirrors SessionTracker plus apply_feedback.
+    """
+    count = len(user_ids)
+    if count == 0:
+        empty = np.zeros(0)
+        return {'session_duration': empty.astype(np.int64), 'mastery_level': empty,
+                'learning_progress': empty, 'interaction_quality': empty}
+
+    deltas = np.diff(timestamps, prepend=timestamps[0])
+    new_session = np.ones(count, dtype=bool)
+    new_session[1:] = (user_ids[1:] != user_ids[:-1]) | (deltas[1:] > gap) | (deltas[1:] < 0)
+    session_ids = np.cumsum(new_session) - 1
+    durations = np.where(new_session, np.nan_to_num(response_times), deltas)
+
+    # Rated rows get their real quality; others the session's mean so far
+    quality = _interaction_quality(helpful, understanding)
+    rated = ~np.isnan(quality)
+    rated_quality = np.where(rated, quality, 0)
+    # Running sums strictly before each row, restarted at each session start
+    before_sum = np.cumsum(rated_quality) - rated_quality
+    before_cnt = np.cumsum(rated) - rated
+    session_start = np.flatnonzero(new_session)[session_ids]
+    prior_sum = before_sum - before_sum[session_start]
+    prior_cnt = before_cnt - before_cnt[session_start]
+    quality = np.where(rated, quality, np.where(prior_cnt > 0, prior_sum / np.maximum(prior_cnt, 1), np.nan))
+
+    # Mastery per (user, topic): running average of understanding / 5 over
+    # rated rows (post-rating value on rated rows, carried forward otherwise)
+    mastery = np.full(count, np.nan)
+    progress = np.full(count, np.nan)
+    order = np.lexsort((np.arange(count), topics, user_ids))
+    keys = np.stack([user_ids[order], topics[order]])
+    boundaries = np.flatnonzero(np.any(keys[:, 1:] != keys[:, :-1], axis=0)) + 1
+    for group in np.split(order, boundaries):
+        if topics[group[0]] < 0:
+            continue
+        scores = understanding[group] / 5.0
+        has_score = ~np.isnan(scores)
+        after = np.full(len(group), np.nan)
+        if has_score.any():
+            after[has_score] = lfilter([0.5], [1, -0.5], scores[has_score])
+        # Last known mastery up to and including each row, then before each row
+        last_index = np.maximum.accumulate(np.where(has_score, np.arange(len(group)), -1))
+        carried = np.where(last_index >= 0, after[np.maximum(last_index, 0)], np.nan)
+        before = np.concatenate([[np.nan], carried[:-1]])
+        mastery[group] = np.where(has_score, after, before)
+
+        group_sessions = session_ids[group]
+        first_in_session = np.ones(len(group), dtype=bool)
+        first_in_session[1:] = group_sessions[1:] != group_sessions[:-1]
+        start = before[np.flatnonzero(first_in_session)[np.cumsum(first_in_session) - 1]]
+        progress[group] = np.clip(before - np.nan_to_num(start), -1, 1)
+
+    return {
+        'session_duration': np.rint(durations).astype(np.int64),
+        'mastery_level': mastery,
+        'learning_progress': progress,
+        'interaction_quality': quality
+    }
+
+def backfill_sessions(gap=SESSION_GAP):
+    """
+    One-off job computing the session fields for every existing ChatHistory
+    row in one pass. Returns the number of rows updated.
+    """
+    rows = db.session.query(
+        ChatHistory.id,
+        ChatHistory.user_id,
+        ChatHistory.timestamp,
+        ChatHistory.topic,
+        ChatHistory.user_understanding,
+        ChatHistory.helpful,
+        ChatHistory.response_time
+    ).order_by(ChatHistory.user_id, ChatHistory.timestamp, ChatHistory.id).all()
+    if not rows:
+        return 0
+
+    ids, user_ids, stamps, topic_names, understanding, helpful, response_times = zip(*rows)
+    epoch = datetime(1970, 1, 1)
+    timestamps = np.array([(ts - epoch).total_seconds() if ts else 0.0 for ts in stamps])
+    topic_index = {}
+    topics = np.array([-1 if t is None else topic_index.setdefault(t, len(topic_index)) for t in topic_names])
+    fields = compute_session_fields(
+        np.array(user_ids),
+        timestamps,
+        topics,
+        np.array([np.nan if u is None else u for u in understanding], dtype=float),
+        np.array([np.nan if h is None else float(h) for h in helpful], dtype=float),
+        np.array([np.nan if r is None else r for r in response_times], dtype=float),
+        gap
+    )
+
+    def value(array, index):
+        item = array[index].item()
+        return None if isinstance(item, float) and np.isnan(item) else item
+
+    for start in range(0, len(ids), BACKFILL_BATCH_SIZE):
+        updates = [
+            {
+                'id': ids[i],
+                'session_duration': value(fields['session_duration'], i),
+                'mastery_level': value(fields['mastery_level'], i),
+                'learning_progress': value(fields['learning_progress'], i),
+                'interaction_quality': value(fields['interaction_quality'], i)
+            }
+            for i in range(start, min(start + BACKFILL_BATCH_SIZE, len(ids)))
+        ]
+        db.session.execute(db.update(ChatHistory), updates)
+        db.session.commit()
+    return len(ids)
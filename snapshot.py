@@ -0,0 +1,292 @@
+import os
+import json
+import shutil
+from datetime import datetime, timedelta
+import numpy as np
+from models import ChatHistory, QuestionnaireResponse, db
+
+# Snapshot layout:
+#   <out_dir>/manifest.json                     tables, segments, dictionaries, last exported id
+#   <out_dir>/<table>/seg-00001/<col>.npy        typed / dictionary-encoded columns
+#   <out_dir>/<table>/seg-00001/<col>.offsets.npy + <col>.blob   text columns (utf-8)
+# Every file can be memory-mapped, so readers never go through the ORM.
+#
+# Segments are append-only (rows with id > last exported id), so only columns
+# that never change after insert are exported. ChatHistory feedback (helpful,
+# user_understanding, feedback_comments) and the derived session fields
+# (mastery_level, interaction_quality, learning_progress, session_duration)
+# are updated later by /chat_feedback* and backfill-sessions; read those from
+# the database, joined on id.
+
+SNAPSHOT_VERSION = 2
+EPOCH = datetime(1970, 1, 1)
+BATCH_SIZE = 1000
+
+# Null sentinels for typed columns
+NULL_INT = -1
+NULL_CODE = -1
+
+ANSWER_COLUMNS = [
+    'study_time', 'session_duration', 'learning_pace',
+    'learning_style', 'content_format', 'feedback_preference',
+    'learning_goals', 'motivators', 'challenges',
+    'interest_areas', 'experience_level', 'learning_tools'
+]
+
+# (column, kind, dtype) - kind is one of int, float, datetime, dict, text, json
+TABLES = {
+    'chat_history': {
+        'model': ChatHistory,
+        'columns': [
+            ('id', 'int', np.int64),
+            ('user_id', 'int', np.int32),
+            ('timestamp', 'datetime', np.int64),
+            ('topic', 'dict', np.int32),
+            ('complexity_level', 'int', np.int8),
+            ('response_time', 'float', np.float32),
+            ('preferred_pace', 'dict', np.int8),
+            ('message', 'text', None),
+            ('response', 'text', None),
+        ]
+    },
+    'questionnaire_response': {
+        'model': QuestionnaireResponse,
+        'columns': [
+            ('id', 'int', np.int64),
+            ('user_id', 'int', np.int32),
+            ('timestamp', 'datetime', np.int64),
+        ] + [(name, 'dict', np.int8) for name in ANSWER_COLUMNS] + [
+            ('learning_difficulty', 'dict', np.int8),
+            ('tdah_responses', 'json', None),
+            ('dyslexia_responses', 'json', None),
+        ]
+    }
+}
+
+def _empty_manifest():
+    return {
+        'version': SNAPSHOT_VERSION,
+        'tables': {
+            name: {'last_id': 0, 'rows': 0, 'segments': [], 'dictionaries': {}}
+            for name in TABLES
+        }
+    }
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, 'manifest.json')
+    if not os.path.exists(path):
+        return _empty_manifest()
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version: {manifest.get('version')}")
+    return manifest
+
+def _write_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, 'manifest.json')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def _encode_column(kind, dtype, values, dictionary):
+    """
+    Encode a list of python values into numpy arrays for one column.
+    Returns a dict of file suffix -> array (or bytes for text blobs).
+    """
+    if kind == 'int':
+        return {'': np.array([NULL_INT if v is None else v for v in values], dtype=dtype)}
+    if kind == 'float':
+        return {'': np.array([np.nan if v is None else v for v in values], dtype=dtype)}
+    if kind == 'datetime':
+        # Microseconds since epoch, naive timestamps are stored as UTC
+        return {'': np.array([
+            NULL_INT if v is None else (v.replace(tzinfo=None) - EPOCH) // timedelta(microseconds=1)
+            for v in values
+        ], dtype=dtype)}
+    if kind == 'dict':
+        # Dictionary grows append-only so codes stay stable across segments
+        index = {value: code for code, value in enumerate(dictionary)}
+        codes = []
+        for v in values:
+            if v is None:
+                codes.append(NULL_CODE)
+                continue
+            code = index.get(v)
+            if code is None:
+                code = len(dictionary)
+                if code > np.iinfo(dtype).max:
+                    raise ValueError(f"Dictionary overflow for {dtype.__name__} column")
+                dictionary.append(v)
+                index[v] = code
+            codes.append(code)
+        return {'': np.array(codes, dtype=dtype)}
+    if kind in ('text', 'json'):
+        encoded = [
+            b'' if v is None else (json.dumps(v, ensure_ascii=False) if kind == 'json' else v).encode('utf-8')
+            for v in values
+        ]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return {'.offsets': offsets, '.blob': b''.join(encoded)}
+    raise ValueError(f"Unknown column kind: {kind}")
+
+def _export_table(out_dir, table_name, table_state):
+    spec = TABLES[table_name]
+    model = spec['model']
+    columns = spec['columns']
+    model_columns = [getattr(model, name) for name, _, _ in columns]
+
+    # Plain column tuples, streamed in id order - no ORM objects are built
+    query = (db.session.query(*model_columns)
+             .filter(model.id > table_state['last_id'])
+             .order_by(model.id)
+             .execution_options(yield_per=BATCH_SIZE))
+    column_values = [[] for _ in columns]
+    for row in query:
+        for position, value in enumerate(row):
+            column_values[position].append(value)
+    row_count = len(column_values[0])
+    if not row_count:
+        return 0
+
+    segment_name = f"seg-{len(table_state['segments']) + 1:05d}"
+    table_dir = os.path.join(out_dir, table_name)
+    segment_dir = os.path.join(table_dir, segment_name)
+    tmp_dir = segment_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    dictionaries = table_state['dictionaries']
+    for (name, kind, dtype), values in zip(columns, column_values):
+        dictionary = dictionaries.setdefault(name, []) if kind == 'dict' else None
+        for suffix, data in _encode_column(kind, dtype, values, dictionary).items():
+            path = os.path.join(tmp_dir, name + suffix)
+            if isinstance(data, bytes):
+                with open(path, 'wb') as f:
+                    f.write(data)
+            else:
+                np.save(path + '.npy', data)
+
+    # A segment left behind by an export that crashed before its manifest write
+    shutil.rmtree(segment_dir, ignore_errors=True)
+    os.replace(tmp_dir, segment_dir)
+    table_state['segments'].append({'name': segment_name, 'rows': row_count})
+    table_state['rows'] += row_count
+    table_state['last_id'] = int(column_values[0][-1])
+    return row_count
+
+def export_snapshot(out_dir):
+    """
+    Append every ChatHistory and QuestionnaireResponse row newer than the last
+    snapshot to a new columnar segment. Returns the number of rows per table.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    exported = {}
+    for table_name in TABLES:
+        table_state = manifest['tables'].setdefault(
+            table_name, {'last_id': 0, 'rows': 0, 'segments': [], 'dictionaries': {}}
+        )
+        exported[table_name] = _export_table(out_dir, table_name, table_state)
+    # Manifest is written last, so a crash leaves the previous snapshot readable
+    _write_manifest(out_dir, manifest)
+    return exported
+
+class Segment:
+    """
+    Read-only, memory-mapped view of one snapshot segment
+    """
+    def __init__(self, path, columns, dictionaries, rows):
+        self.path = path
+        self.rows = rows
+        self._kinds = {name: kind for name, kind, _ in columns}
+        self._dictionaries = dictionaries
+        self._cache = {}
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name):
+        """Typed array (dictionary codes for dict columns, offsets for text columns)"""
+        kind = self._kinds[name]
+        key = name + ('.offsets' if kind in ('text', 'json') else '')
+        if key not in self._cache:
+            self._cache[key] = np.load(os.path.join(self.path, key + '.npy'), mmap_mode='r')
+        return self._cache[key]
+
+    def blob(self, name):
+        key = name + '.blob'
+        if key not in self._cache:
+            path = os.path.join(self.path, key)
+            # np.memmap cannot map empty files
+            if os.path.getsize(path) == 0:
+                self._cache[key] = np.zeros(0, dtype=np.uint8)
+            else:
+                self._cache[key] = np.memmap(path, dtype=np.uint8, mode='r')
+        return self._cache[key]
+
+    def _decode_text(self, name, data):
+        raw = data.tobytes().decode('utf-8')
+        if self._kinds[name] == 'json':
+            return json.loads(raw) if raw else None
+        return raw
+
+    def text(self, name, index):
+        """Value of a text column (json columns decoded) at one row"""
+        offsets = self.column(name)
+        return self._decode_text(name, self.blob(name)[offsets[index]:offsets[index + 1]])
+
+    def iter_text(self, name):
+        """Values of a text column in row order, decoded like text()"""
+        offsets = self.column(name)
+        blob = self.blob(name)
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield self._decode_text(name, blob[start:end])
+
+    def decode(self, name):
+        """Dictionary-decoded values of a dict column (None for nulls)"""
+        dictionary = self._dictionaries.get(name, [])
+        return [dictionary[code] if code >= 0 else None for code in self.column(name)]
+
+class Snapshot:
+    """
+    Entry point for offline readers (topic extraction, similarity index and
+    cohort analytics rebuilds)
+    """
+    def __init__(self, out_dir):
+        self.path = out_dir
+        self.manifest = load_manifest(out_dir)
+
+    def dictionary(self, table_name, column):
+        return self.manifest['tables'][table_name]['dictionaries'].get(column, [])
+
+    def last_id(self, table_name):
+        return self.manifest['tables'][table_name]['last_id']
+
+    def segments(self, table_name):
+        table_state = self.manifest['tables'][table_name]
+        columns = TABLES[table_name]['columns']
+        for segment in table_state['segments']:
+            yield Segment(
+                os.path.join(self.path, table_name, segment['name']),
+                columns,
+                table_state['dictionaries'],
+                segment['rows']
+            )
+
+    def column(self, table_name, name):
+        """Concatenated typed column across all segments (copies; use segments() for zero-copy)"""
+        kinds = {n: kind for n, kind, _ in TABLES[table_name]['columns']}
+        if kinds[name] in ('text', 'json'):
+            # Offsets are relative to each segment's blob; read values with iter_text
+            raise ValueError(f"{table_name}.{name} is a {kinds[name]} column, use iter_text()")
+        arrays = [segment.column(name) for segment in self.segments(table_name)]
+        if not arrays:
+            dtype = {n: d for n, _, d in TABLES[table_name]['columns']}[name] or np.int64
+            return np.zeros(0, dtype=dtype)
+        return np.concatenate(arrays)
+
+    def iter_text(self, table_name, name):
+        for segment in self.segments(table_name):
+            yield from segment.iter_text(name)
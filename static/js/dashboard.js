@@ -186,18 +186,7 @@ function submitFeedback(chatId, helpful, button) {
         feedbackStatus.style.color = helpful ? '#198754' : '#dc3545';
     }
 
-    fetch('/chat_feedback', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-            'Authorization': token
-        },
-        body: JSON.stringify({
-            chat_id: chatId,
-            helpful: helpful
-        })
-    })
-    .catch(error => console.error('Error submitting feedback:', error));
+    queueFeedback(chatId, { helpful: helpful });
 }
 
 function submitUnderstanding(chatId, level, button) {
@@ -224,27 +213,61 @@ function submitUnderstanding(chatId, level, button) {
         feedbackStatus.style.color = '#0d6efd';
     }
 
-    fetch('/chat_feedback', {
+    queueFeedback(chatId, { understanding: level });
+}
+
+// Ratings are batched: a thumbs + comprehension rating for the same message
+// becomes one item, and everything queued within the debounce window is sent
+// in a single request.
+const FEEDBACK_DEBOUNCE_MS = 1000;
+let pendingFeedback = {};
+let feedbackTimer = null;
+
+function queueFeedback(chatId, fields) {
+    pendingFeedback[chatId] = Object.assign(pendingFeedback[chatId] || { chat_id: chatId }, fields);
+    clearTimeout(feedbackTimer);
+    feedbackTimer = setTimeout(flushFeedback, FEEDBACK_DEBOUNCE_MS);
+}
+
+function flushFeedback(keepalive = false) {
+    clearTimeout(feedbackTimer);
+    feedbackTimer = null;
+
+    const items = Object.values(pendingFeedback);
+    if (items.length === 0) return;
+    pendingFeedback = {};
+
+    const token = localStorage.getItem('token');
+    if (!token) return;
+
+    fetch('/chat_feedback_batch', {
         method: 'POST',
+        keepalive: keepalive,
         headers: {
             'Content-Type': 'application/json',
             'Authorization': token
         },
-        body: JSON.stringify({
-            chat_id: chatId,
-            understanding: level
-        })
+        body: JSON.stringify({ items: items })
     })
-    .catch(error => console.error('Error submitting understanding level:', error));
+    .catch(error => console.error('Error submitting feedback:', error));
 }
 
+// Don't lose queued ratings when the tab is hidden or closed
+document.addEventListener('visibilitychange', function() {
+    if (document.visibilityState === 'hidden') flushFeedback(true);
+});
+window.addEventListener('pagehide', function() {
+    flushFeedback(true);
+});
+
 function appendMessage(type, content, chatId = null) {
     const chatMessages = document.getElementById('chatMessages');
     const messageDiv = document.createElement('div');
     messageDiv.className = `chat-message ${type}-message`;
     messageDiv.textContent = content;
 
-    if (type === 'ai') {
+    // Degraded fallbacks come without a chat_id and can't be rated
+    if (type === 'ai' && chatId) {
         const feedbackDiv = document.createElement('div');
         feedbackDiv.className = 'feedback-buttons mt-2';
         feedbackDiv.innerHTML = `
@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The app reads these at import time; tests run against in-memory SQLite
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("MISTRAL_API_KEY", "test")
+
+import pytest
+
+@pytest.fixture
+def app_context():
+    from app import app
+    from models import db
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app
+        db.session.rollback()
+
+@pytest.fixture
+def user(app_context):
+    from models import User, db
+    user = User(email='alumno@example.com', questionnaire_completed=True)
+    db.session.add(user)
+    db.session.commit()
+    return user
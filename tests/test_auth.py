@@ -0,0 +1,81 @@
+"""
+Token verification and the token_hash upgrade path for databases created
+before the column existed.
+"""
+import datetime
+import jwt
+import pytest
+from sqlalchemy import inspect, text
+from app import app
+from models import User, db, upgrade_schema
+from auth import backfill_token_hashes, generate_token, hash_token, token_cache
+
+# "user" table as created before token_hash was added
+OLD_USER_TABLE = '''
+CREATE TABLE "user" (
+    id INTEGER PRIMARY KEY,
+    email VARCHAR(120) NOT NULL UNIQUE,
+    token VARCHAR(500) UNIQUE,
+    password_hash VARCHAR(256),
+    user_type VARCHAR(20),
+    questionnaire_completed BOOLEAN NOT NULL,
+    interaction_count INTEGER
+)
+'''
+
+@pytest.fixture
+def old_database(app_context):
+    db.drop_all()
+    with db.engine.begin() as conn:
+        conn.execute(text(OLD_USER_TABLE))
+    token_cache.clear()
+    yield
+    db.session.rollback()
+    db.drop_all()
+
+def add_legacy_user(user_id, email):
+    token = generate_token(user_id)
+    with db.engine.begin() as conn:
+        conn.execute(
+            text('INSERT INTO "user" (id, email, token, questionnaire_completed) VALUES (:id, :email, :token, 0)'),
+            {'id': user_id, 'email': email, 'token': token}
+        )
+    return token
+
+def test_upgrade_adds_column_and_backfills(old_database):
+    token = add_legacy_user(1, 'antiguo@example.com')
+    upgrade_schema()
+    upgrade_schema()  # idempotent
+
+    columns = {column['name'] for column in inspect(db.engine).get_columns('user')}
+    assert 'token_hash' in columns
+    assert backfill_token_hashes() == 1
+    assert db.session.get(User, 1).token_hash == hash_token(token)
+    assert backfill_token_hashes() == 0
+
+    response = app.test_client().post('/login', json={'token': token})
+    assert response.status_code == 200
+
+def test_login_fills_missing_token_hash(old_database):
+    token = add_legacy_user(1, 'antiguo@example.com')
+    upgrade_schema()
+
+    client = app.test_client()
+    assert client.post('/login', json={'token': token}).status_code == 200
+    db.session.expire_all()
+    assert db.session.get(User, 1).token_hash == hash_token(token)
+
+    # A valid token for the same user that isn't the one stored is rejected
+    other = jwt.encode({
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1),
+        'sub': 1,
+        'jti': 'otro'
+    }, app.config.get('SECRET_KEY'), algorithm='HS256')
+    assert client.post('/login', json={'token': other}).status_code == 401
+
+def test_token_without_exp_is_rejected(user):
+    token = jwt.encode({'sub': user.id}, app.config.get('SECRET_KEY'), algorithm='HS256')
+    user.token, user.token_hash = token, hash_token(token)
+    db.session.commit()
+    token_cache.clear()
+    assert app.test_client().post('/login', json={'token': token}).status_code == 401
@@ -0,0 +1,117 @@
+"""
+/chat_feedback and /chat_feedback_batch: coalescing, ownership and the
+mastery chain kept in step with analyze_user_progress.
+"""
+from datetime import datetime, timedelta
+import pytest
+from app import app
+from models import ChatHistory, User, db
+from auth import generate_token, hash_token
+from chatbot import analyze_user_progress
+
+START = datetime(2026, 3, 2, 9, 0, 0)
+
+def login(user):
+    user.token = generate_token(user.id)
+    user.token_hash = hash_token(user.token)
+    db.session.commit()
+    return {'Authorization': user.token}
+
+def add_chats(user, topics, start=START):
+    chats = []
+    for i, topic in enumerate(topics):
+        chat = ChatHistory(
+            user_id=user.id, message=f'pregunta {i}', response='respuesta',
+            timestamp=start + timedelta(minutes=i), topic=topic
+        )
+        db.session.add(chat)
+        chats.append(chat)
+    db.session.commit()
+    return [chat.id for chat in chats]
+
+def stored(chat_id):
+    db.session.expire_all()
+    return db.session.get(ChatHistory, chat_id)
+
+def send(headers, *items):
+    return app.test_client().post('/chat_feedback_batch', json={'items': list(items)}, headers=headers)
+
+def assert_mastery_matches_progress(user, topic, chat_ids):
+    expected = analyze_user_progress(user.id)['mastery_scores'][topic]
+    assert stored(chat_ids[-1]).mastery_level == pytest.approx(expected)
+
+def test_batch_coalesces_items_per_chat(user):
+    headers = login(user)
+    first, second = add_chats(user, ['listas', 'bucles'])
+    response = send(
+        headers,
+        {'chat_id': first, 'helpful': True},
+        {'chat_id': str(first), 'understanding': 4},
+        {'chat_id': second, 'comments': 'claro'}
+    )
+    assert response.status_code == 200
+    assert response.get_json() == {'message': 'Feedback received', 'updated': 2, 'not_found': []}
+
+    chat = stored(first)
+    assert (chat.helpful, chat.user_understanding) == (True, 4)
+    assert chat.interaction_quality == pytest.approx((1.0 + 0.75) / 2)
+    assert chat.mastery_level == pytest.approx(0.4)
+    chat = stored(second)
+    assert chat.feedback_comments == 'claro'
+    assert chat.interaction_quality is None and chat.mastery_level is None
+
+def test_feedback_only_touches_own_chats(user):
+    headers = login(user)
+    other = User(email='otro@example.com', questionnaire_completed=True)
+    db.session.add(other)
+    db.session.commit()
+    (own,) = add_chats(user, ['listas'])
+    (foreign,) = add_chats(other, ['listas'])
+
+    response = send(headers, {'chat_id': own, 'helpful': True}, {'chat_id': foreign, 'helpful': False})
+    assert response.get_json()['not_found'] == [foreign]
+    assert stored(foreign).helpful is None
+
+    single = app.test_client().post('/chat_feedback', json={'chat_id': foreign, 'helpful': True}, headers=headers)
+    assert single.status_code == 404
+    assert stored(foreign).helpful is None
+
+def test_rerating_recomputes_mastery(user):
+    headers = login(user)
+    chat_ids = add_chats(user, ['listas', 'listas'])
+    send(headers, {'chat_id': chat_ids[0], 'understanding': 3})
+    send(headers, {'chat_id': chat_ids[1], 'understanding': 4})
+    # A later message stores the mastery it was asked at
+    (later,) = add_chats(user, ['listas'], START + timedelta(minutes=2))
+    chat = stored(later)
+    chat.mastery_level = stored(chat_ids[1]).mastery_level
+    db.session.commit()
+
+    # Re-rating must not build on the rating it replaces
+    send(headers, {'chat_id': chat_ids[1], 'understanding': 5})
+    assert stored(chat_ids[1]).mastery_level == pytest.approx((0.3 + 1.0) / 2)
+    assert stored(later).mastery_level == pytest.approx((0.3 + 1.0) / 2)
+    assert_mastery_matches_progress(user, 'listas', chat_ids + [later])
+
+def test_rating_older_chat_updates_later_mastery(user):
+    headers = login(user)
+    chat_ids = add_chats(user, ['listas', 'bucles', 'listas', 'listas'])
+    send(headers, {'chat_id': chat_ids[2], 'understanding': 4})
+    send(headers, {'chat_id': chat_ids[0], 'understanding': 2})
+
+    assert stored(chat_ids[0]).mastery_level == pytest.approx(0.2)
+    assert stored(chat_ids[2]).mastery_level == pytest.approx((0.2 + 0.8) / 2)
+    # Unrated later messages carry the topic's latest mastery
+    assert stored(chat_ids[3]).mastery_level == pytest.approx(0.5)
+    assert stored(chat_ids[1]).mastery_level is None
+    assert_mastery_matches_progress(user, 'listas', chat_ids)
+
+@pytest.mark.parametrize('body, error', [
+    ({'helpful': True}, 'Chat ID is required'),
+    ({'chat_id': 'tres', 'helpful': True}, 'Chat ID must be an integer'),
+    ({'chat_id': 1, 'understanding': 6}, 'Invalid understanding value for chat 1'),
+])
+def test_invalid_feedback(user, body, error):
+    response = app.test_client().post('/chat_feedback', json=body, headers=login(user))
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
@@ -0,0 +1,212 @@
+"""
+Fault scenarios from benchmarks/llm_faults.py, asserted against the local
+Mistral API stub (no network or API key needed).
+"""
+import time
+import pytest
+from mistralai.client import MistralClient
+from mistralai.exceptions import MistralAPIException
+from mistralai.models.chat_completion import ChatMessage
+from benchmarks.llm_faults import FAULTS, start_stub
+from llm_client import ResilientLLMClient, CircuitBreaker, DEGRADED_RESPONSE, HEDGE_MIN_SAMPLES
+from metrics import metrics
+
+HEALTHY = {'error_rate': 0.0, 'slow_rate': 0.0, 'slow_delay': 0.0, 'delay': 0.02, 'slow_next': 0,
+           'drop_rate': 0.0}
+
+@pytest.fixture(scope='module')
+def endpoint():
+    server, endpoint = start_stub()
+    yield endpoint
+    server.shutdown()
+
+@pytest.fixture(autouse=True)
+def healthy_stub():
+    FAULTS.update(HEALTHY)
+    yield
+    FAULTS.update(HEALTHY)
+
+def make_client(endpoint, failures=3, reset_timeout=0.3, **kwargs):
+    kwargs.setdefault('attempt_timeout', 1.0)
+    kwargs.setdefault('max_attempts', 1)
+    return ResilientLLMClient(
+        MistralClient(api_key='stub', endpoint=endpoint, max_retries=0, timeout=2.0),
+        breaker=CircuitBreaker(failure_threshold=failures, reset_timeout=reset_timeout, name='test'),
+        **kwargs
+    )
+
+def ask(client, question, system=None, model='mistral-tiny'):
+    messages = [ChatMessage(role='user', content=question)]
+    if system is not None:
+        messages.insert(0, ChatMessage(role='system', content=system))
+    return client.chat(model=model, messages=messages, max_tokens=50)
+
+def test_healthy_call_reports_attempt_latency(endpoint):
+    result = ask(make_client(endpoint), 'pregunta')
+    assert result.source == 'upstream'
+    assert result.content == 'respuesta de prueba'
+    assert result.usage.completion_tokens == 3
+    assert result.latency is not None and result.latency >= FAULTS['delay']
+
+def test_breaker_opens_after_consecutive_failures(endpoint):
+    client = make_client(endpoint, failures=3)
+    FAULTS['error_rate'] = 1.0
+    for _ in range(2):
+        ask(client, 'pregunta')
+        assert client.breaker.state == CircuitBreaker.CLOSED
+    ask(client, 'pregunta')
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    rejected = metrics.snapshot()['counters'].get('llm.breaker.rejected', 0)
+    ask(client, 'pregunta')
+    assert metrics.snapshot()['counters']['llm.breaker.rejected'] == rejected + 1
+
+def test_dropped_connections_count_as_failures(endpoint, monkeypatch):
+    monkeypatch.setattr('llm_client.backoff_delay', lambda attempt: 0)
+    client = make_client(endpoint, failures=3, max_attempts=2)
+    assert ask(client, 'pregunta').source == 'upstream'
+
+    FAULTS['drop_rate'] = 1.0
+    retries = metrics.snapshot()['counters'].get('llm.retry', 0)
+    assert ask(client, 'pregunta').source == 'cache'
+    assert metrics.snapshot()['counters']['llm.retry'] == retries + 1
+    assert ask(client, 'otra pregunta').source == 'degraded'
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+def test_client_errors_do_not_touch_breaker_health(endpoint, monkeypatch):
+    client = make_client(endpoint, failures=1, reset_timeout=0.2)
+    FAULTS['error_rate'] = 1.0
+    ask(client, 'pregunta')
+    time.sleep(client.breaker.reset_timeout)
+
+    def bad_request(kwargs):
+        raise MistralAPIException('Status: 400', http_status=400)
+
+    monkeypatch.setattr(client, '_attempt', bad_request)
+    with pytest.raises(MistralAPIException):
+        ask(client, 'pregunta')
+    # The probe slot is released but the breaker isn't closed by our own error
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+    assert client.breaker.allow()
+
+def test_client_errors_keep_failure_count(endpoint, monkeypatch):
+    client = make_client(endpoint, failures=2)
+    FAULTS['error_rate'] = 1.0
+    ask(client, 'pregunta')
+
+    original = client._attempt
+    def bad_request(kwargs):
+        raise MistralAPIException('Status: 422', http_status=422)
+
+    monkeypatch.setattr(client, '_attempt', bad_request)
+    with pytest.raises(MistralAPIException):
+        ask(client, 'pregunta')
+    monkeypatch.setattr(client, '_attempt', original)
+    ask(client, 'pregunta')
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+def test_outage_serves_cached_then_degraded(endpoint):
+    client = make_client(endpoint, failures=2)
+    assert ask(client, 'Qué es  una función?').source == 'upstream'
+
+    FAULTS['error_rate'] = 1.0
+    cached = ask(client, 'qué es una función?')
+    assert cached.source == 'cache'
+    assert cached.content == 'respuesta de prueba'
+    assert cached.latency is None
+    degraded = ask(client, 'otra pregunta')
+    assert degraded.source == 'degraded'
+    assert degraded.content == DEGRADED_RESPONSE
+    # Breaker is open by now; fallbacks keep being served without upstream calls
+    assert client.breaker.state == CircuitBreaker.OPEN
+    assert ask(client, 'qué es una función?').source == 'cache'
+
+def test_cache_is_scoped_to_the_whole_prompt(endpoint):
+    client = make_client(endpoint)
+    assert ask(client, 'pregunta', system='perfil A').source == 'upstream'
+
+    FAULTS['error_rate'] = 1.0
+    assert ask(client, 'pregunta', system='perfil A').source == 'cache'
+    assert ask(client, 'pregunta', system='perfil B').source == 'degraded'
+    assert ask(client, 'pregunta').source == 'degraded'
+
+def test_breaker_closes_after_reset_timeout(endpoint):
+    client = make_client(endpoint, failures=1, reset_timeout=0.2)
+    FAULTS['error_rate'] = 1.0
+    ask(client, 'pregunta')
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    FAULTS['error_rate'] = 0.0
+    # Still open: upstream has recovered but isn't tried yet
+    assert ask(client, 'pregunta').source == 'degraded'
+    time.sleep(client.breaker.reset_timeout)
+    assert ask(client, 'pregunta').source == 'upstream'
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+def test_failed_probe_reopens_breaker(endpoint):
+    client = make_client(endpoint, failures=1, reset_timeout=0.2)
+    FAULTS['error_rate'] = 1.0
+    ask(client, 'pregunta')
+    time.sleep(client.breaker.reset_timeout)
+    ask(client, 'pregunta')
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+def test_retries_recover_from_transient_failure(endpoint, monkeypatch):
+    monkeypatch.setattr('llm_client.backoff_delay', lambda attempt: 0)
+    client = make_client(endpoint, failures=5, max_attempts=3)
+    calls = []
+    original = client._attempt
+
+    def flaky_attempt(kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise TimeoutError('injected')
+        return original(kwargs)
+
+    monkeypatch.setattr(client, '_attempt', flaky_attempt)
+    result = ask(client, 'pregunta')
+    assert result.source == 'upstream'
+    assert len(calls) == 2
+    # Only the successful attempt counts towards the latency model
+    assert result.latency < 1.0
+
+def test_deadline_raises_timeout(endpoint):
+    client = make_client(endpoint, attempt_timeout=0.2)
+    FAULTS.update({'slow_rate': 1.0, 'slow_delay': 0.5})
+    kwargs = {
+        'model': 'mistral-tiny',
+        'messages': [ChatMessage(role='user', content='pregunta')],
+        'max_tokens': 50
+    }
+    start = time.time()
+    with pytest.raises(TimeoutError):
+        client._attempt(kwargs)
+    assert time.time() - start < 0.45
+    # chat() turns the timeout into a fallback instead of raising
+    assert client.chat(**kwargs).source == 'degraded'
+
+def test_hedge_fires_on_slow_tail(endpoint):
+    model = 'hedge-test'
+    client = make_client(endpoint, hedge=True, attempt_timeout=2.0)
+    for _ in range(HEDGE_MIN_SAMPLES):
+        ask(client, 'calentamiento', model=model)
+
+    counters = metrics.snapshot()['counters']
+    fired, won = counters.get('llm.hedge.fired', 0), counters.get('llm.hedge.won', 0)
+    FAULTS.update({'slow_next': 1, 'slow_delay': 1.0})
+    start = time.time()
+    result = ask(client, 'pregunta lenta', model=model)
+    elapsed = time.time() - start
+
+    assert result.source == 'upstream'
+    assert elapsed < 0.5
+    counters = metrics.snapshot()['counters']
+    assert counters['llm.hedge.fired'] == fired + 1
+    assert counters['llm.hedge.won'] == won + 1
+
+def test_hedge_disabled_waits_for_slow_call(endpoint):
+    client = make_client(endpoint, hedge=False, attempt_timeout=2.0)
+    FAULTS.update({'slow_next': 1, 'slow_delay': 0.3})
+    start = time.time()
+    assert ask(client, 'pregunta lenta').source == 'upstream'
+    assert time.time() - start >= 0.3
@@ -0,0 +1,87 @@
+"""
+Online session tracking (SessionTracker at insert time, apply_feedback on
+ratings) must agree with the vectorized backfill over the same rows, also
+when several worker processes, each with its own tracker, serve one user.
+"""
+from datetime import datetime, timedelta
+import pytest
+from app import app  # noqa: F401 (initializes models)
+from models import ChatHistory, db
+from sessions import SessionTracker, backfill_sessions, compute_session_fields
+from chatbot import apply_feedback
+
+FIELDS = ('session_duration', 'mastery_level', 'learning_progress', 'interaction_quality')
+START = datetime(2026, 3, 2, 9, 0, 0)
+
+# (seconds since START, topic, feedback given right after the answer)
+CONVERSATION = [
+    (0, 'listas', {'understanding': 3}),
+    (60, 'listas', None),
+    (120, 'bucles', {'helpful': True}),
+    (180, 'listas', {'understanding': 5, 'helpful': False}),
+    (240, 'bucles', {'understanding': 2}),
+    (300, None, None),
+    (360, 'listas', None),
+    # New session after an hour of inactivity
+    (4000, 'bucles', None),
+    (4060, 'listas', {'understanding': 4}),
+    (4120, 'listas', None),
+    (4180, 'bucles', {'helpful': True, 'understanding': 5}),
+    (4240, 'bucles', None),
+]
+
+def converse(user_id, trackers, response_time=1.0):
+    for i, (offset, topic, feedback) in enumerate(CONVERSATION):
+        tracker = trackers[i % len(trackers)]
+        timestamp = START + timedelta(seconds=offset)
+        fields = tracker.record_interaction(user_id, topic, response_time, timestamp)
+        chat = ChatHistory(
+            user_id=user_id, message=f'pregunta {i}', response='respuesta', timestamp=timestamp,
+            topic=topic, response_time=response_time, **fields
+        )
+        db.session.add(chat)
+        db.session.commit()
+        if feedback:
+            assert apply_feedback(user_id, [dict(feedback, chat_id=chat.id)]) == []
+            db.session.commit()
+
+def stored_fields():
+    rows = ChatHistory.query.order_by(ChatHistory.id).all()
+    return [{field: getattr(row, field) for field in FIELDS} for row in rows]
+
+def assert_same(online, backfilled):
+    assert len(online) == len(backfilled)
+    for index, (a, b) in enumerate(zip(online, backfilled)):
+        for field in FIELDS:
+            if a[field] is None or b[field] is None:
+                assert a[field] == b[field], (index, field)
+            else:
+                assert a[field] == pytest.approx(b[field]), (index, field)
+
+@pytest.mark.parametrize('workers', [1, 2, 3])
+def test_online_tracking_matches_backfill(user, workers):
+    converse(user.id, [SessionTracker() for _ in range(workers)])
+    online = stored_fields()
+
+    assert backfill_sessions() == len(CONVERSATION)
+    assert_same(online, stored_fields())
+
+def test_session_duration_is_not_inflated_across_workers(user):
+    converse(user.id, [SessionTracker(), SessionTracker()])
+    durations = [row['session_duration'] for row in stored_fields()]
+    # First message of each session counts its response time, later ones the gap
+    assert durations == [1, 60, 60, 60, 60, 60, 60, 1, 60, 60, 60, 60]
+    assert sum(durations[:7]) == 360 + 1
+
+def test_new_user_session_starts_with_response_time(user):
+    fields = SessionTracker().record_interaction(user.id, 'listas', 2.4, START)
+    assert fields == {
+        'session_duration': 2,
+        'mastery_level': None,
+        'learning_progress': None,
+        'interaction_quality': None
+    }
+
+def test_compute_session_fields_empty():
+    empty = compute_session_fields(*[[]] * 6)
+    assert all(len(values) == 0 for values in empty.values())
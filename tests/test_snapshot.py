@@ -0,0 +1,59 @@
+"""
+Columnar snapshot export and the memory-mapped readers.
+"""
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from app import app
+from models import ChatHistory, QuestionnaireResponse, db
+from snapshot import Snapshot, export_snapshot
+
+START = datetime(2026, 3, 2, 9, 0, 0)
+
+def add_chats(user, messages, start=0):
+    for i, message in enumerate(messages, start):
+        db.session.add(ChatHistory(
+            user_id=user.id, message=message, response=f'respuesta {i}',
+            timestamp=START + timedelta(minutes=i), topic='listas' if i % 2 else None
+        ))
+    db.session.commit()
+
+def test_export_appends_segments(user, tmp_path):
+    add_chats(user, ['uno', 'dos', 'tres'])
+    assert export_snapshot(tmp_path)['chat_history'] == 3
+    assert export_snapshot(tmp_path)['chat_history'] == 0
+    add_chats(user, ['cuatro', 'cinco'], start=3)
+    assert export_snapshot(tmp_path)['chat_history'] == 2
+
+    snapshot = Snapshot(tmp_path)
+    assert [len(segment) for segment in snapshot.segments('chat_history')] == [3, 2]
+    ids = snapshot.column('chat_history', 'id')
+    assert ids.tolist() == [1, 2, 3, 4, 5]
+    assert snapshot.last_id('chat_history') == 5
+    assert list(snapshot.iter_text('chat_history', 'message')) == ['uno', 'dos', 'tres', 'cuatro', 'cinco']
+
+    codes = snapshot.column('chat_history', 'topic')
+    assert codes.tolist() == [-1, 0, -1, 0, -1]
+    assert snapshot.dictionary('chat_history', 'topic') == ['listas']
+    stamps = snapshot.column('chat_history', 'timestamp').astype('datetime64[us]')
+    assert stamps[1] == np.datetime64(START + timedelta(minutes=1))
+
+def test_text_columns_are_not_concatenated(user, tmp_path):
+    add_chats(user, ['uno', 'dos'])
+    export_snapshot(tmp_path)
+    add_chats(user, ['tres'], start=2)
+    export_snapshot(tmp_path)
+    with pytest.raises(ValueError):
+        Snapshot(tmp_path).column('chat_history', 'message')
+
+def test_json_columns_decode_consistently(user, tmp_path):
+    answers = {'q1': 'A', 'q2': ['B', 'C']}
+    db.session.add(QuestionnaireResponse(user_id=user.id, learning_pace='B', tdah_responses=answers))
+    db.session.commit()
+    export_snapshot(tmp_path)
+
+    (segment,) = Snapshot(tmp_path).segments('questionnaire_response')
+    assert segment.text('tdah_responses', 0) == answers
+    assert list(segment.iter_text('tdah_responses')) == [answers]
+    assert list(segment.iter_text('dyslexia_responses')) == [None]
+    assert segment.decode('learning_pace') == ['B']
@@ -0,0 +1,7 @@
+from app import app
+from chatbot import preload_nlp_resources
+
+# Entry point for multi-process serving (see gunicorn.conf.py). With
+# preload_app the master imports this module once, so the app and its NLP
+# resources are loaded before workers are forked.
+preload_nlp_resources()